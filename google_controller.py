@@ -1,23 +1,156 @@
 #!/usr/bin/env python3
 import os
+import selectors
 import socket
 import time
 import threading
 import PIL.Image
+from PIL import ImageStat
 import signal
 import sys
 import atexit
 import argparse
 import json
 import pickle
+import queue
 import textwrap
+import traceback
 import pyjson5
 from collections import deque
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from typing import Dict, List, Any, Tuple
 
 # Import from your existing modules
 from pokemon_logger import PokemonLogger
 
+# Button name -> key index understood by the emulator Lua script
+BUTTON_MAP = {
+    "A": 0, "B": 1, "SELECT": 2, "START": 3,
+    "RIGHT": 4, "LEFT": 5, "UP": 6, "DOWN": 7,
+    "R": 8, "L": 9
+}
+
+# Wire form of every key index, so sending a button is a single prebuilt write
+BUTTON_BYTES = {code: f"{code}\n".encode('ascii') for code in BUTTON_MAP.values()}
+
+# Read up to this many bytes per recv() so queued emulator messages arrive in one call
+RECV_BUFFER_SIZE = 64 * 1024
+
+# Emulator connections handled at once; further connections queue for a free worker
+MAX_CLIENT_WORKERS = 4
+
+# Seconds shutdown waits for client handlers; one stuck in an LLM call is abandoned
+CLIENT_SHUTDOWN_TIMEOUT = 1.0
+
+# Static prompt text, built once at import so every request carries identical bytes
+SYSTEM_PROMPT = textwrap.dedent("""\
+    You are currently playing Pokémon Yellow. You should output a JSON object containing the following keys:
+    {
+    thoughts: string;
+    memory: any;
+    buttons: ("A" | "B" | "UP" | "DOWN" | "LEFT" | "RIGHT" | "START")[];
+    }
+
+    "thoughts": A short string in which you should analyze the current situation and think step-by-step about what to do next. This will also serve as live commentary, read out to the YouTube audience.
+    "memory": Arbitrary JSON containing notes to your future self. This should include both short and long term goals and important information you learn. This is the only information that will be passed to your future self, so you should include anything from the previous session that you still want to remember including any important lessons that you've learned while removing anything no longer relevant to save on token cost. For example, if something you've tried to achieve a goal has not worked many times in a row, you might want to record it in your memory for future reference.
+    "buttons": A sequence of button presses you want to input into the game. These will be entered one second apart so you can safely navigate entire tiles or select menu options. To be efficient, try to plan ahead and input as many button presses in sequence as you can.
+
+    Only output JSON. Do not include a Markdown block around it.
+    """)
+
+RECENT_TURNS_PROMPT = "Next is the summary of your most recent turns. Study them closely. What did you intend to do? Did you succeed? What went wrong? What did you learn, and what should you do next?"
+
+# Number of past turns summarized in each prompt
+PROMPT_TURNS = 5
+
+# Appended turn records in the history file before they are merged into one list
+HISTORY_COMPACT_RECORDS = 100
+
+# Per-turn guidance; only the game state placeholders are filled in each decision
+NAVIGATION_TIPS_TEMPLATE = textwrap.dedent("""
+    ## Navigation Tips:
+    - To INTERACT with objects or NPCs, you MUST be FACING them and then press A
+    - Your current direction is {direction} (facing {facing})
+    - Your current position is (X={x}, Y={y}) on map {map_name}
+    - If you need to face a different direction, press the appropriate directional button first
+    - In buildings, look for exits via stairs, doors, or red mats and walk directly over them
+    - The current status of textbox is {textbox}
+    - If there is textbox show, you cannot move
+    """)
+
+SCREENSHOT_PROMPT = "The screenshot is the current in-game situation. Respond accordingly."
+
+# Compass wording for the direction the player is facing
+FACING_DIRECTIONS = {
+    "UP": "north",
+    "DOWN": "south",
+    "LEFT": "west",
+    "RIGHT": "east"
+}
+
+# Pokémon Red/Blue map IDs (incomplete, add more as needed)
+MAP_NAMES = {
+    0: "Pallet Town",
+    1: "Viridian City",
+    2: "Pewter City",
+    3: "Cerulean City",
+    12: "Route 1",
+    13: "Route 2",
+    14: "Route 3",
+    15: "Route 4",
+    37: "Player's House 1F",
+    38: "Player's House 2F",
+    39: "Blue's House",
+    40: "Oak's Lab",
+    # Add more map IDs as you explore the game
+}
+
+# Screenshot enhancement factors, as ImageEnhance would apply them in this order
+CONTRAST_FACTOR = 1.5    # +50% contrast
+SATURATION_FACTOR = 1.8  # +80% saturation
+BRIGHTNESS_FACTOR = 1.1  # +10% brightness
+
+# ITU-R 601-2 luma weights, the ones PIL uses for RGB -> L
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def enhance_screenshot(image):
+    """
+    Apply the contrast, saturation and brightness boosts with colour-matrix passes
+    
+    Args:
+        image (PIL.Image.Image): Screenshot to enhance
+        
+    Returns:
+        PIL.Image.Image: Enhanced RGB image
+    """
+    rgb_image = image.convert("RGB")
+    # Contrast pivots around the mean grey level, exactly as ImageEnhance.Contrast does
+    mean = int(ImageStat.Stat(rgb_image.convert("L")).mean[0] + 0.5)
+    
+    # contrast: c = k*x + (1 - k)*mean, in its own pass so it is clipped before
+    # saturation mixes the channels, as with ImageEnhance
+    k = CONTRAST_FACTOR
+    offset = (1 - k) * mean
+    contrast_image = rgb_image.convert("RGB", (
+        k, 0.0, 0.0, offset,
+        0.0, k, 0.0, offset,
+        0.0, 0.0, k, offset,
+    ))
+    
+    # saturation: s = f*c + (1 - f)*luma(c), then brightness: out = b*s; a gain >= 1
+    # clips the same before or after, so brightness shares the saturation pass
+    f, b = SATURATION_FACTOR, BRIGHTNESS_FACTOR
+    matrix = []
+    for channel in range(3):
+        matrix.extend(b * ((f if i == channel else 0.0) + (1 - f) * weight)
+                      for i, weight in enumerate(LUMA_WEIGHTS))
+        matrix.append(0.0)
+    return contrast_image.convert("RGB", tuple(matrix))
+
 class Tool:
     """Simple class to define a tool for the LLM"""
     def __init__(self, name: str, description: str, parameters: List[Dict[str, Any]]):
@@ -58,20 +191,17 @@ class GeminiClient:
         self._setup_client()
     
     def _setup_client(self):
-        """Set up the Gemini client"""
+        """Set up the Gemini client and the model handle shared by every call"""
         import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         self.client = genai
+        self.model = genai.GenerativeModel(model_name=self.model_name)
     
     def call_with_tools(self, history: any, message: str, tools: List[Tool], images: List[PIL.Image.Image] = None) -> Tuple[Any, List[ToolCall], str]:
         """
         Call Gemini with the given message and tools, optionally including images
         """
-        import google.generativeai as genai
-        
-        model = self.client.GenerativeModel(model_name=self.model_name)
-        
-        chat = model.start_chat(
+        chat = self.model.start_chat(
             history=history
         )
         
@@ -95,31 +225,35 @@ class GeminiClient:
         tool_calls = []
         
         try:
-            if hasattr(response, "candidates"):
-                for candidate in response.candidates:
-                    if hasattr(candidate, "content") and candidate.content:
-                        for part in candidate.content.parts:
-                            if hasattr(part, "function_call") and part.function_call:
-                                if hasattr(part.function_call, "name") and part.function_call.name:
-                                    args = {}
-                                    if hasattr(part.function_call, "args") and part.function_call.args is not None:
-                                        try:
-                                            if hasattr(part.function_call.args, "items"):
-                                                for key, value in part.function_call.args.items():
-                                                    args[key] = str(value)
-                                            else:
-                                                args = {"argument": str(part.function_call.args)}
-                                        except:
-                                            pass
-                                    
-                                    tool_calls.append(ToolCall(
-                                        id=f"call_{len(tool_calls)}",
-                                        name=part.function_call.name,
-                                        arguments=args
-                                    ))
+            for candidate in getattr(response, "candidates", None) or ():
+                content = getattr(candidate, "content", None)
+                if not content:
+                    continue
+                for part in content.parts:
+                    # Look each attribute up once; proto attribute access is not cheap
+                    function_call = getattr(part, "function_call", None)
+                    name = getattr(function_call, "name", None) if function_call else None
+                    if not name:
+                        continue
+                    
+                    args = {}
+                    raw_args = getattr(function_call, "args", None)
+                    if raw_args is not None:
+                        try:
+                            if hasattr(raw_args, "items"):
+                                args = {key: str(value) for key, value in raw_args.items()}
+                            else:
+                                args = {"argument": str(raw_args)}
+                        except:
+                            pass
+                    
+                    tool_calls.append(ToolCall(
+                        id=f"call_{len(tool_calls)}",
+                        name=name,
+                        arguments=args
+                    ))
         except Exception as e:
             print(f"Error parsing Gemini tool calls: {e}")
-            import traceback
             print(traceback.format_exc())
         
         for call in tool_calls:
@@ -151,20 +285,26 @@ class PokemonController:
         self._cleanup_done = False
         self._cleanup_lock = threading.Lock()
         
-        # Load config directly from JSON file
+        # Load config directly from JSON file (orjson when available)
         try:
-            with open(config_path, 'r') as f:
-                self.config = json.load(f)
+            # Size the read from fstat so the file is pulled in with one read() call
+            fd = os.open(config_path, os.O_RDONLY)
+            try:
+                config_bytes = os.read(fd, os.fstat(fd).st_size)
+            finally:
+                os.close(fd)
+            self.config = orjson.loads(config_bytes) if orjson else json.loads(config_bytes)
         except Exception as e:
             print(f"Failed to load config from {config_path}: {e}")
             sys.exit(1)
         
-        # Ensure paths are absolute
-        if 'notepad_path' in self.config and not os.path.isabs(self.config['notepad_path']):
-            self.config['notepad_path'] = os.path.abspath(self.config['notepad_path'])
-            
-        if 'screenshot_path' in self.config and not os.path.isabs(self.config['screenshot_path']):
-            self.config['screenshot_path'] = os.path.abspath(self.config['screenshot_path'])
+        # Ensure paths are absolute (resolve against a single cwd snapshot)
+        cwd = None
+        for key in ('notepad_path', 'tips_path', 'screenshot_path', 'recent_actions_path'):
+            path = self.config.get(key)
+            if path and not os.path.isabs(path):
+                cwd = cwd or os.getcwd()
+                self.config[key] = os.path.normpath(os.path.join(cwd, path))
         
         provider_config = self.config["providers"]["google"]
         
@@ -175,16 +315,40 @@ class PokemonController:
         )
         
         self.server_socket = None
+        self.accept_selector = None
+        # Writing a byte to the wakeup socket interrupts the blocking accept loop on shutdown
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
         self.tools = self._define_tools()
         
         self.notepad_path = self.config['tips_path']
+        # (st_mtime_ns, st_size, content) of the last notepad read
+        self._notepad_cache = None
         self.screenshot_path = self.config['screenshot_path']
         self.recent_actions_path = self.config['recent_actions_path']
-        self.current_client = None
-        self.running = True
+        # Sockets of connected emulators, so cleanup can close them from another thread
+        self.active_clients = set()
+        self._clients_lock = threading.Lock()
+        # Set once on shutdown; every loop checks it and the wakeup socket interrupts their waits
+        self._stop = threading.Event()
         self.decision_cooldown = self.config['decision_cooldown']
         self.button_cooldown = self.config.get('button_cooldown', 3.0)
-        self.client_threads = []
+        # Whole-number enlargement factor for screenshots sent to the LLM (1 = native size)
+        try:
+            self.screenshot_scale = int(self.config.get('screenshot_scale', 1))
+            if self.screenshot_scale < 1:
+                raise ValueError("must be 1 or greater")
+        except (TypeError, ValueError) as e:
+            print(f"Invalid screenshot_scale in {config_path}: {e}")
+            sys.exit(1)
+        # Reused daemon workers serving accepted connections from a queue; being daemons,
+        # a worker blocked in an LLM call cannot hold up process exit
+        self.client_queue = queue.Queue()
+        self.client_workers = [
+            threading.Thread(target=self._client_worker, name=f"emulator-client-{i}", daemon=True)
+            for i in range(MAX_CLIENT_WORKERS)
+        ]
+        for worker in self.client_workers:
+            worker.start()
         self.debug_mode = self.config.get('debug_mode', False)
         
         # Game state tracking
@@ -198,8 +362,28 @@ class PokemonController:
         self.is_processing = False
         self.emulator_ready = False
         
-        # Modified: Store timestamp, button, full reasoning text, and position/direction
-        self.recent_actions = deque(maxlen=10)
+        # Emulator message type -> handler(content, client_socket)
+        self._message_handlers = {
+            b"ready": self._handle_ready,
+            b"screenshot_with_state": self._handle_screenshot,
+        }
+        
+        # Recent turns (thoughts, memory, buttons), loaded once and kept in memory;
+        # the deque bounds only the in-memory copy, the history file keeps every turn
+        try:
+            self.action_history_window = int(self.config.get('action_history_window', 10))
+            if self.action_history_window < 1:
+                raise ValueError("must be 1 or greater")
+        except (TypeError, ValueError) as e:
+            print(f"Invalid action_history_window in {config_path}: {e}")
+            sys.exit(1)
+        # Pickled records in the history file, counted towards the next compaction
+        self._history_records = 0
+        self.recent_actions = deque(self.get_recent_actions_text(), maxlen=self.action_history_window)
+        # Prompt lines for the newest turns, rendered once when each turn is recorded
+        self.recent_turn_lines = deque(
+            (self.format_turn(turn) for turn in self.recent_actions), maxlen=PROMPT_TURNS
+        )
         
         os.makedirs(os.path.dirname(self.notepad_path), exist_ok=True)
         os.makedirs(os.path.dirname(self.screenshot_path), exist_ok=True)
@@ -257,16 +441,27 @@ class PokemonController:
             except (AttributeError, OSError):
                 self.logger.debug("TCP keepalive options not fully supported")
             
-            try:
-                self.server_socket.bind((self.config['host'], self.config['port']))
-            except socket.error:
-                self.logger.warning(f"Port {self.config['port']} in use. Attempting to free it...")
-                os.system(f"lsof -ti:{self.config['port']} | xargs kill -9")
-                time.sleep(1)
-                self.server_socket.bind((self.config['host'], self.config['port']))
+            # SO_REUSEADDR covers a port left in TIME_WAIT by a previous run; give a
+            # controller that is still shutting down a moment to release it
+            retry_delays = (0.1, 0.25, 0.5, 1.0)
+            for attempt, delay in enumerate(retry_delays + (None,), start=1):
+                try:
+                    self.server_socket.bind((self.config['host'], self.config['port']))
+                    break
+                except socket.error:
+                    if delay is None:
+                        raise
+                    self.logger.warning(f"Port {self.config['port']} in use. Retrying in {delay}s ({attempt}/{len(retry_delays)})...")
+                    time.sleep(delay)
             
             self.server_socket.listen(1)
-            self.server_socket.settimeout(1)
+            self.server_socket.setblocking(False)
+            
+            # Block until a connection arrives or shutdown is requested, instead of
+            # waking up every second to check for a stop request
+            self.accept_selector = selectors.DefaultSelector()
+            self.accept_selector.register(self.server_socket, selectors.EVENT_READ)
+            self.accept_selector.register(self._wakeup_reader, selectors.EVENT_READ)
             self.logger.success(f"Socket server set up on {self.config['host']}:{self.config['port']}")
         except socket.error as e:
             self.logger.error(f"Socket setup error: {e}")
@@ -275,9 +470,50 @@ class PokemonController:
     def signal_handler(self, sig, frame):
         """Handle termination signals"""
         print(f"\nReceived signal {sig}. Shutting down server...")
-        self.running = False
+        self.stop()
+        # Let the handlers return before their sockets are closed underneath them
+        self.shutdown_clients()
         self.cleanup()
         sys.exit(0)
+    
+    def stop(self):
+        """Ask the accept loop and every client handler to finish"""
+        self._stop.set()
+        self.wake_accept_loop()
+    
+    def shutdown_clients(self):
+        """Stop the client workers, waiting at most CLIENT_SHUTDOWN_TIMEOUT seconds for them"""
+        workers, self.client_workers = self.client_workers, []
+        if not workers:
+            return
+        # Close connections no worker has picked up yet
+        while True:
+            try:
+                client_socket, _ = self.client_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                client_socket.close()
+            except:
+                pass
+        for _ in workers:
+            self.client_queue.put(None)
+        deadline = time.monotonic() + CLIENT_SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+    
+    def wake_accept_loop(self):
+        """Interrupt the accept loop so it notices that the server is stopping"""
+        try:
+            self._wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+        
+    def _log_traceback(self):
+        """Log the active exception's traceback; formatting is skipped outside debug mode"""
+        if not self.debug_mode:
+            return
+        self.logger.debug(traceback.format_exc())
         
     def cleanup(self):
         """Clean up resources"""
@@ -287,10 +523,18 @@ class PokemonController:
             self._cleanup_done = True
             
             self.logger.section("Cleaning up resources...")
-            if self.current_client:
+            with self._clients_lock:
+                clients = list(self.active_clients)
+                self.active_clients.clear()
+            for client_socket in clients:
                 try:
-                    self.current_client.close()
-                    self.current_client = None
+                    client_socket.close()
+                except:
+                    pass
+            if self.accept_selector:
+                try:
+                    self.accept_selector.close()
+                    self.accept_selector = None
                 except:
                     pass
             if self.server_socket:
@@ -299,6 +543,11 @@ class PokemonController:
                     self.server_socket = None
                 except:
                     pass
+            for wakeup_socket in (self._wakeup_reader, self._wakeup_writer):
+                try:
+                    wakeup_socket.close()
+                except:
+                    pass
             self.logger.success("Cleanup complete")
             time.sleep(0.5)
 
@@ -313,10 +562,16 @@ class PokemonController:
                 f.write("## Map of Yellow house, Stair is on top right of the scene, exit is on the first floor\n\n")
 
     def read_notepad(self):
-        """Read the current notepad content"""
+        """Read the current notepad content, reusing the last read while the file is unchanged"""
         try:
+            st = os.stat(self.notepad_path)
+            cache = self._notepad_cache
+            if cache and cache[0] == st.st_mtime_ns and cache[1] == st.st_size:
+                return cache[2]
             with open(self.notepad_path, 'r') as f:
-                return f.read()
+                content = f.read()
+            self._notepad_cache = (st.st_mtime_ns, st.st_size, content)
+            return content
         except Exception as e:
             print(f"Error reading notepad: {e}")
             return "Error reading notepad"
@@ -368,73 +623,94 @@ class PokemonController:
 
     def get_recent_actions_text(self):
         """Get formatted text of recent actions with reasoning and position/direction"""
-        if not os.path.exists(self.recent_actions_path):
+        if os.path.exists(self.recent_actions_path):
+            turns_list, self._history_records = self._load_history_file()
+            if turns_list:
+                return turns_list
+        else:
             os.makedirs(os.path.dirname(self.recent_actions_path), exist_ok=True)
-            return [{
-                "turn": 0,
-                "thoughts": "",
-                "memory": "",
-                "buttons": "",
-            }]
-        pk_file = open(self.recent_actions_path, 'rb')
-        turns_list = pickle.load(pk_file)
-        pk_file.close()
-        return turns_list
+        # No file yet, or nothing readable in it
+        return [{
+            "turn": 0,
+            "thoughts": "",
+            "memory": "",
+            "buttons": "",
+        }]
     
-    def update_recent_actions(self, actions_list):
-        pk_file = open(self.recent_actions_path, 'wb')
-        pickle.dump(actions_list, pk_file)
-        pk_file.close()
-
-    def get_direction_guidance_text(self):
-        """Generate guidance text about player orientation and interactions"""
-        directions = {
-            "UP": "north",
-            "DOWN": "south", 
-            "LEFT": "west",
-            "RIGHT": "east"
-        }
+    def _load_history_file(self):
+        """
+        Read every turn from the history file
         
-        facing_direction = directions.get(self.player_direction, self.player_direction)
-
-        textbox_status = "false" if self.textbox == 0 else "true"
+        The file is a sequence of pickled records: a list of turns (older files, or the
+        result of compaction) followed by single turns appended one per decision. A record
+        cut short by an interrupted write is truncated away so later appends stay readable.
         
-        guidance = f"""
-        ## Navigation Tips:
-        - To INTERACT with objects or NPCs, you MUST be FACING them and then press A
-        - Your current direction is {self.player_direction} (facing {facing_direction})
-        - Your current position is (X={self.player_x}, Y={self.player_y}) on map {self.get_map_name(self.map_id)}
-        - If you need to face a different direction, press the appropriate directional button first
-        - In buildings, look for exits via stairs, doors, or red mats and walk directly over them
-        - The current status of textbox is {textbox_status}
-        - If there is textbox show, you cannot move
+        Returns:
+            tuple: (list of all turns in order, number of pickled records read)
         """
+        turns_list = []
+        records = 0
+        with open(self.recent_actions_path, 'rb') as pk_file:
+            while True:
+                offset = pk_file.tell()
+                try:
+                    record = pickle.load(pk_file)
+                except (EOFError, pickle.UnpicklingError, ValueError, AttributeError,
+                        ImportError, IndexError, KeyError, TypeError):
+                    # End of file, or a torn record: anything after it could never be read
+                    corrupt = offset < os.fstat(pk_file.fileno()).st_size
+                    break
+                records += 1
+                if isinstance(record, list):
+                    turns_list.extend(record)
+                else:
+                    turns_list.append(record)
+        if corrupt:
+            os.truncate(self.recent_actions_path, offset)
+        return turns_list, records
+    
+    def format_turn(self, turn):
+        """Render one past turn as the summary line shown to the LLM"""
+        return f"Turn {turn['turn']}. Internal thoughts: {turn['thoughts']}; Button presses: {json.dumps(turn['buttons'])}."
+    
+    def update_recent_actions(self, action):
+        """Append one turn to the history file, merging the records once enough pile up"""
+        with open(self.recent_actions_path, 'ab') as pk_file:
+            pickle.dump(action, pk_file)
+        self._history_records += 1
         
-        return guidance
+        if self._history_records >= HISTORY_COMPACT_RECORDS:
+            # Rewrite every turn as a single list record; no turn is dropped
+            turns_list, _ = self._load_history_file()
+            tmp_path = self.recent_actions_path + '.tmp'
+            with open(tmp_path, 'wb') as pk_file:
+                pickle.dump(turns_list, pk_file)
+            os.replace(tmp_path, self.recent_actions_path)
+            self._history_records = 1
+
+    def get_direction_guidance_text(self):
+        """Generate guidance text about player orientation and interactions"""
+        return NAVIGATION_TIPS_TEMPLATE.format(
+            direction=self.player_direction,
+            facing=FACING_DIRECTIONS.get(self.player_direction, self.player_direction),
+            x=self.player_x,
+            y=self.player_y,
+            map_name=self.get_map_name(self.map_id),
+            textbox="false" if self.textbox == 0 else "true",
+        )
 
     def get_map_name(self, map_id):
         """Get map name from ID, with fallback for unknown maps"""
-        # Pokémon Red/Blue map IDs (incomplete, add more as needed)
-        map_names = {
-            0: "Pallet Town",
-            1: "Viridian City",
-            2: "Pewter City",
-            3: "Cerulean City",
-            12: "Route 1",
-            13: "Route 2",
-            14: "Route 3",
-            15: "Route 4",
-            37: "Player's House 1F",
-            38: "Player's House 2F",
-            39: "Blue's House",
-            40: "Oak's Lab",
-            # Add more map IDs as you explore the game
-        }
-        
-        return map_names.get(map_id, f"Unknown Area (Map ID: {map_id})")
+        return MAP_NAMES.get(map_id, f"Unknown Area (Map ID: {map_id})")
     
     def loose_parse_json(self, json_string: str):
         json_substring = json_string[json_string.find("{") : json_string.rfind("}") + 1]
+        # Most replies are strict JSON; only fall back to the lenient JSON5 parser when needed
+        if orjson:
+            try:
+                return orjson.loads(json_substring)
+            except orjson.JSONDecodeError:
+                pass
         return pyjson5.loads(json_substring)
 
     def process_screenshot(self, screenshot_path=None):
@@ -446,77 +722,57 @@ class PokemonController:
         self.is_processing = True
         try:
             notepad_content = self.read_notepad()
-            recent_actions = self.get_recent_actions_text()
+            last_turn = self.recent_actions[-1]
             direction_guidance = self.get_direction_guidance_text()
-            self.logger.debug(f"direction guide: {direction_guidance}")
-            current_memory = recent_actions[-1]["memory"]
+            if self.debug_mode:
+                self.logger.debug(f"direction guide: {direction_guidance}")
+            current_memory = last_turn["memory"]
             
             path_to_use = screenshot_path if screenshot_path else self.screenshot_path
             
-            if not os.path.exists(path_to_use):
+            # Load and enhance the image; a missing file surfaces from open() itself
+            try:
+                original_image = PIL.Image.open(path_to_use)
+            except FileNotFoundError:
                 self.logger.error(f"Screenshot not found at {path_to_use}")
-                self.is_processing = False
                 return None
             
-            # Load and enhance the image
-            original_image = PIL.Image.open(path_to_use)
-            
-            # Scale the image to 3x its original size for better detail recognition
-            scale_factor = 3
-            scaled_width = original_image.width * scale_factor
-            scaled_height = original_image.height * scale_factor
-            scaled_image = original_image.resize((scaled_width, scaled_height), PIL.Image.LANCZOS)
-            
-            # Enhance contrast for better visibility
-            from PIL import ImageEnhance
-            contrast_enhancer = ImageEnhance.Contrast(scaled_image)
-            contrast_image = contrast_enhancer.enhance(1.5)  # Increase contrast by 50%
-            
-            # Enhance color saturation for better color visibility
-            saturation_enhancer = ImageEnhance.Color(contrast_image)
-            enhanced_image = saturation_enhancer.enhance(1.8)  # Increase saturation by 80%
+            # Boost contrast, saturation and brightness for better visibility in one pass
+            final_image = enhance_screenshot(original_image)
             
-            # Optionally enhance brightness slightly
-            brightness_enhancer = ImageEnhance.Brightness(enhanced_image)
-            final_image = brightness_enhancer.enhance(1.1)  # Increase brightness by 10%
+            # The model tiles the image itself, so the native frame is sent unless a
+            # larger one is configured; nearest-neighbour keeps the pixel art crisp
+            if self.screenshot_scale > 1:
+                final_image = final_image.resize(
+                    (final_image.width * self.screenshot_scale, final_image.height * self.screenshot_scale),
+                    PIL.Image.NEAREST
+                )
 
             history=[
-                {
-                    "role": "user", 
-                    "parts": [textwrap.dedent(
-                        """\
-                You are currently playing Pokémon Yellow. You should output a JSON object containing the following keys:
-                {
-                thoughts: string;
-                memory: any;
-                buttons: ("A" | "B" | "UP" | "DOWN" | "LEFT" | "RIGHT" | "START")[];
-                }
-                
-                "thoughts": A short string in which you should analyze the current situation and think step-by-step about what to do next. This will also serve as live commentary, read out to the YouTube audience.
-                "memory": Arbitrary JSON containing notes to your future self. This should include both short and long term goals and important information you learn. This is the only information that will be passed to your future self, so you should include anything from the previous session that you still want to remember including any important lessons that you've learned while removing anything no longer relevant to save on token cost. For example, if something you've tried to achieve a goal has not worked many times in a row, you might want to record it in your memory for future reference.
-                "buttons": A sequence of button presses you want to input into the game. These will be entered one second apart so you can safely navigate entire tiles or select menu options. To be efficient, try to plan ahead and input as many button presses in sequence as you can.
-                
-                Only output JSON. Do not include a Markdown block around it.
-                            """
-                    )]},
                 {
                     "role": "user",
-                    "parts": [f"""Here is your current working memory in JSON: {json.dumps(current_memory)}"""],
+                    "parts": [SYSTEM_PROMPT],
                 },
+                # Keep the slow-changing expert notes ahead of the per-turn memory so the
+                # prompt prefix stays identical between turns and can be reused by the provider
                 {
                     "role": "user",
                     "parts": [f"""Here is information from expert: {notepad_content}"""],
                 },
                 {
                     "role": "user",
-                    "parts": [f"Next is the summary of your most recent turns. Study them closely. What did you intend to do? Did you succeed? What went wrong? What did you learn, and what should you do next?"],
+                    "parts": [f"""Here is your current working memory in JSON: {json.dumps(current_memory)}"""],
+                },
+                {
+                    "role": "user",
+                    "parts": [RECENT_TURNS_PROMPT],
                 },
                 {
                     "role": "user",
-                    "parts": [f"Turn {turn['turn']}. Internal thoughts: {turn['thoughts']}; Button presses: {json.dumps(turn['buttons'])}." for turn in recent_actions[-5:]],   
+                    "parts": list(self.recent_turn_lines),
                 }]
             
-            prompt = f"{direction_guidance}\nThe screenshot is the current in-game situation. Respond accordingly."
+            prompt = f"{direction_guidance}\n{SCREENSHOT_PROMPT}"
             
             images = [final_image]
             self.logger.section(f"Requesting decision from LLM")
@@ -531,14 +787,15 @@ class PokemonController:
             gpt_response = self.loose_parse_json(text)
 
             next_action = {
-                "turn": recent_actions[-1]["turn"] + 1,
+                "turn": last_turn["turn"] + 1,
                 "thoughts": gpt_response["thoughts"],
                 "memory": gpt_response["memory"],
                 "buttons": gpt_response["buttons"]
             }
-            recent_actions.append(next_action)
+            self.recent_actions.append(next_action)
+            self.recent_turn_lines.append(self.format_turn(next_action))
 
-            self.update_recent_actions(recent_actions)
+            self.update_recent_actions(next_action)
             
             #print(f"LLM Text Response: {text}")
             print(f"AI Thoughts: {gpt_response['thoughts']}")
@@ -546,154 +803,203 @@ class PokemonController:
             print(f"Buttons: {gpt_response['buttons']}")
             
             button_list = []
+            # Encoded commands, resolved here so the send path is a plain sendall()
+            wire_list = []
             
             for button in gpt_response["buttons"]:
-                button = button.upper()
-                button_map = {
-                    "A": 0, "B": 1, "SELECT": 2, "START": 3,
-                    "RIGHT": 4, "LEFT": 5, "UP": 6, "DOWN": 7,
-                    "R": 8, "L": 9
-                }
-                    
-                if button in button_map:
-                    button_code = button_map[button]
-                    #self.logger.success(f"Tool used button: {button}")
-                        
+                button_code = BUTTON_MAP.get(button.upper())
+                if button_code is not None:
                     button_list.append(button_code)
+                    wire_list.append(BUTTON_BYTES[button_code])
 
             if len(button_list) == 0:
                 self.logger.warning("No press_button tool call found!")
 
-            return {'button_list': button_list}
+            return {'button_list': button_list, 'wire_list': wire_list}
             
         except Exception as e:
             self.logger.error(f"Error processing screenshot: {e}")
-            if self.debug_mode:
-                import traceback
-                self.logger.debug(traceback.format_exc())
+            self._log_traceback()
         finally:
             self.is_processing = False
         return None
 
+    def _pop_messages(self, buffer):
+        """
+        Remove every complete message from the receive buffer
+        
+        Messages are "type||content\n" lines. Only the latest message of each type
+        is returned, so a burst of queued "ready" notifications (one per button
+        press) still triggers a single screenshot request.
+        
+        Args:
+            buffer (bytearray): Received bytes; consumed lines are deleted from it
+            
+        Returns:
+            list: (message_type, content) byte pairs in arrival order
+        """
+        messages = {}
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end]).strip()
+            start = end + 1
+            
+            message_type, separator, content = line.partition(b"||")
+            if separator:
+                messages.pop(message_type, None)
+                messages[message_type] = content
+        # Drop the consumed lines in one go rather than shifting the buffer per line
+        if start:
+            del buffer[:start]
+        return list(messages.items())
+
+    def _handle_ready(self, content, client_socket):
+        """Emulator finished the last command: request a screenshot once the cooldown allows"""
+        self.logger.game_state("Emulator is ready for next command")
+        self.emulator_ready = True
+        
+        # Check if cooldown period has passed
+        current_time = time.time()
+        time_since_last_decision = current_time - self.last_decision_time
+        
+        if time_since_last_decision < self.decision_cooldown:
+            wait_time = self.decision_cooldown - time_since_last_decision
+            if self.debug_mode:
+                self.logger.debug(f"Waiting {wait_time:.2f}s for cooldown before next request")
+            if self._stop.wait(wait_time):
+                return
+        
+        # Request a screenshot if we're not currently processing one
+        if not self.is_processing:
+            try:
+                self.logger.debug("Requesting screenshot from emulator")
+                client_socket.send(b'request_screenshot\n')
+            except Exception as e:
+                self.logger.error(f"Failed to request screenshot: {e}")
+    
+    def _handle_screenshot(self, content, client_socket):
+        """Parse a screenshot_with_state message, ask the LLM for a decision and send the buttons"""
+        self.logger.game_state("Received new screenshot with game state from emulator")
+        
+        # Parse the content which now includes game state
+        content = content.split(b"||")
+        if len(content) >= 5:  # Path, direction, x, y, mapId
+            screenshot_path = content[0].decode('utf-8')
+            self.player_direction = content[1].decode('ascii')
+            self.player_x = int(content[2])
+            self.player_y = int(content[3])
+            self.map_id = int(content[4])
+            self.textbox = int(content[5])
+            
+            if self.debug_mode:
+                self.logger.debug(f"Game State: Direction={self.player_direction}, " +
+                                 f"Position=({self.player_x}, {self.player_y}), " +
+                                 f"Map ID={self.map_id}")
+        
+            # Process the screenshot with game state info
+            decision = self.process_screenshot(screenshot_path)
+            
+            if decision and decision.get('button_list') is not None:
+                self.emulator_ready = False
+                        
+                # Update the last decision time
+                self.last_decision_time = time.time()
+
+                for button_code, payload in zip(decision['button_list'], decision['wire_list']):
+                    # The server may have been stopped while the LLM was thinking
+                    if self._stop.is_set():
+                        break
+                    try:
+                        if self.debug_mode:
+                            self.logger.debug(f"Sending button code to emulator: {button_code}")
+                        client_socket.sendall(payload)
+                        self.logger.debug("Button command sent to emulator")
+                        if self._stop.wait(self.button_cooldown):
+                            break
+
+                    except Exception as e:
+                        self.logger.error(f"Failed to send button command: {e}")  
+            else:
+                # If no decision was made, we still need to respect the cooldown
+                self.last_decision_time = time.time()
+                
+                # Request another screenshot after a small delay
+                try:
+                    if self._stop.wait(0.5):  # Small delay to avoid flooding
+                        return
+                    client_socket.send(b'request_screenshot\n')
+                except Exception as e:
+                    self.logger.error(f"Failed to request another screenshot: {e}")
+
     def handle_client(self, client_socket, client_address):
         """Handle communication with the emulator client"""
         self.logger.section(f"Connected to emulator at {client_address}")
-        self.current_client = client_socket
         self.last_decision_time = 0  # Track the time of last decision
         
         self.logger.game_state("Waiting for game data...")
         
-        while self.running:
+        # Bytes received but not yet consumed; messages can span or share recv() calls
+        buffer = bytearray()
+        # Fixed landing area reused by every recv_into() on this connection
+        recv_buffer = bytearray(RECV_BUFFER_SIZE)
+        recv_view = memoryview(recv_buffer)
+        
+        # Sleep until the emulator sends something instead of spinning on recv();
+        # stop() makes the wakeup socket readable, which ends the wait immediately
+        selector = selectors.DefaultSelector()
+        selector.register(client_socket, selectors.EVENT_READ)
+        selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        
+        while not self._stop.is_set():
             try:
-                data = client_socket.recv(1024)
-                if not data:
+                events = selector.select(timeout=1.0)
+                if self._stop.is_set():
                     break
+                if not events:
+                    continue
+                received = client_socket.recv_into(recv_buffer)
+                if not received:
+                    break
+                buffer += recv_view[:received]
                 
-                message = data.decode('utf-8').strip()
-                parts = message.split("||")
-                
-                if len(parts) >= 2:
-                    message_type = parts[0]
-                    content = parts[1:]  # Get all remaining parts
-                    
-                    # Handle the "ready" message from the emulator
-                    if message_type == "ready":
-                        self.logger.game_state("Emulator is ready for next command")
-                        self.emulator_ready = True
-                        
-                        # Check if cooldown period has passed
-                        current_time = time.time()
-                        time_since_last_decision = current_time - self.last_decision_time
-                        
-                        if time_since_last_decision < self.decision_cooldown:
-                            wait_time = self.decision_cooldown - time_since_last_decision
-                            self.logger.debug(f"Waiting {wait_time:.2f}s for cooldown before next request")
-                            time.sleep(wait_time)
-                        
-                        # Request a screenshot if we're not currently processing one
-                        if not self.is_processing:
-                            try:
-                                self.logger.debug("Requesting screenshot from emulator")
-                                client_socket.send(b'request_screenshot\n')
-                            except Exception as e:
-                                self.logger.error(f"Failed to request screenshot: {e}")
-                    
-                    # Handle the screenshot_with_state message type
-                    elif message_type == "screenshot_with_state":
-                        self.logger.game_state("Received new screenshot with game state from emulator")
-                        
-                        # Parse the content which now includes game state
-                        if len(content) >= 5:  # Path, direction, x, y, mapId
-                            screenshot_path = content[0]
-                            self.player_direction = content[1]
-                            self.player_x = int(content[2])
-                            self.player_y = int(content[3])
-                            self.map_id = int(content[4])
-                            self.textbox = int(content[5])
-                            
-                            self.logger.debug(f"Game State: Direction={self.player_direction}, " +
-                                             f"Position=({self.player_x}, {self.player_y}), " +
-                                             f"Map ID={self.map_id}")
-                        
-                            # Verify the file exists
-                            if os.path.exists(screenshot_path):
-                                # Process the screenshot with game state info
-                                decision = self.process_screenshot(screenshot_path)
-                                
-                                if decision and decision.get('button_list') is not None:
-                                    self.emulator_ready = False
-                                            
-                                    # Update the last decision time
-                                    self.last_decision_time = time.time()
-
-                                    for button_code in decision.get('button_list'):
-                                        try:
-                                            button_code = str(button_code)
-                                            self.logger.debug(f"Sending button code to emulator: {button_code}")
-                                            client_socket.send(button_code.encode('utf-8') + b'\n')
-                                            self.logger.debug("Button command sent to emulator")
-                                            time.sleep(self.button_cooldown)
-
-                                        except Exception as e:
-                                            self.logger.error(f"Failed to send button command: {e}")  
-                                else:
-                                    # If no decision was made, we still need to respect the cooldown
-                                    self.last_decision_time = time.time()
-                                    
-                                    # Request another screenshot after a small delay
-                                    try:
-                                        time.sleep(0.5)  # Small delay to avoid flooding
-                                        client_socket.send(b'request_screenshot\n')
-                                    except Exception as e:
-                                        self.logger.error(f"Failed to request another screenshot: {e}")
-                            else:
-                                self.logger.error(f"Screenshot file not found at {screenshot_path}")
+                for message_type, content in self._pop_messages(buffer):
+                    handler = self._message_handlers.get(message_type)
+                    if handler is None:
+                        self.logger.warning(f"Ignoring unknown message type: {message_type!r}")
+                        continue
+                    handler(content, client_socket)
                 
             except socket.error as e:
-                if e.args[0] != socket.EWOULDBLOCK and str(e) != 'Resource temporarily unavailable':
-                    self.logger.error(f"Socket error: {e}")
-                    break
+                self.logger.error(f"Socket error: {e}")
+                break
             except Exception as e:
                 self.logger.error(f"Error handling client: {e}")
-                if self.debug_mode:
-                    import traceback
-                    self.logger.debug(traceback.format_exc())
-                if not self.running:
-                    break
+                self._log_traceback()
                 continue
-            
-            # Add a small delay to avoid CPU spinning
-            time.sleep(0.01)
         
+        selector.close()
+        recv_view.release()
         self.logger.section(f"Disconnected from emulator at {client_address}")
-        self.current_client = None
         try:
             client_socket.close()
         except:
             pass
 
+    def _client_worker(self):
+        """Serve queued connections until shutdown_clients() posts a None sentinel"""
+        while True:
+            item = self.client_queue.get()
+            if item is None:
+                return
+            self.handle_client_connection(*item)
+
     def handle_client_connection(self, client_socket, client_address):
         """Wrapper around handle_client"""
+        with self._clients_lock:
+            self.active_clients.add(client_socket)
         try:
             self.handle_client(client_socket, client_address)
         except Exception as e:
@@ -704,19 +1010,24 @@ class PokemonController:
                     client_socket.close()
                 except:
                     pass
-            if self.current_client == client_socket:
-                self.current_client = None
+            with self._clients_lock:
+                self.active_clients.discard(client_socket)
 
     def start(self):
         """Start the controller server"""
         self.logger.header(f"Starting Pokémon Game Controller")
         
         try:
-            while self.running:
+            while not self._stop.is_set():
                 try:
                     self.logger.section("Waiting for emulator connection...")
+                    events = self.accept_selector.select()
+                    if self._stop.is_set() or any(key.fileobj is self._wakeup_reader for key, _ in events):
+                        break
                     client_socket, client_address = self.server_socket.accept()
                     client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    # Button commands are a few bytes each; don't let Nagle hold them back
+                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     try:
                         client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
                         client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
@@ -724,34 +1035,24 @@ class PokemonController:
                     except (AttributeError, OSError):
                         pass
                     
-                    client_socket.setblocking(0)
-                    client_thread = threading.Thread(
-                        target=self.handle_client_connection,
-                        args=(client_socket, client_address)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    self.client_threads.append(client_thread)
-                except socket.timeout:
+                    client_socket.setblocking(True)
+                    self.client_queue.put((client_socket, client_address))
+                except BlockingIOError:
+                    # The pending connection went away between select() and accept()
                     continue
                 except KeyboardInterrupt:
                     self.logger.section("Keyboard interrupt detected. Shutting down...")
                     break
                 except Exception as e:
-                    if self.running:
+                    if not self._stop.is_set():
                         self.logger.error(f"Error in main loop: {e}")
-                        if self.debug_mode:
-                            import traceback
-                            self.logger.debug(traceback.format_exc())
+                        self._log_traceback()
                         time.sleep(1)
         finally:
-            self.running = False
+            self.stop()
             self.logger.section("Closing all client connections...")
-            for t in self.client_threads:
-                try:
-                    t.join(timeout=1)
-                except:
-                    pass
+            # Handlers wake on the stop signal and return; wait briefly, drop queued ones
+            self.shutdown_clients()
             self.cleanup()
             self.logger.success("Server shut down cleanly")
 
@@ -1,4 +1,5 @@
 import base64
+import functools
 import json
 import time
 import sys
@@ -21,7 +22,6 @@ except Exception as e:
     print(f"Failed to load config from {config_path}: {e}")
     sys.exit(1)
 
-import PIL
 import google.generativeai as genai
 
 genai.configure(api_key=CONFIG["providers"]["google"]["api_key"])
@@ -43,11 +43,19 @@ load_savestate = False
 pyboy = PyBoy(CONFIG["gameboy_rom"])
 pyboy.set_emulation_speed(3)
 
+# Last notepad read, reused until the file's mtime or size changes
+_notepad_cache = {"mtime_ns": None, "size": None, "text": ""}
+
 def read_notepad():
     """Read the current notepad content"""
     try:
+        st = os.stat(CONFIG["tips_path"])
+        if st.st_mtime_ns == _notepad_cache["mtime_ns"] and st.st_size == _notepad_cache["size"]:
+            return _notepad_cache["text"]
         with open(CONFIG["tips_path"], 'r') as f:
-            return f.read()
+            text = f.read()
+        _notepad_cache.update(mtime_ns=st.st_mtime_ns, size=st.st_size, text=text)
+        return text
     except Exception as e:
         print(f"Error reading notepad: {e}")
         return "Error reading notepad"
@@ -57,6 +65,14 @@ def encode_image(image_path):
         return base64.b64encode(image_file.read()).decode("utf-8")
 
 
+@functools.lru_cache(maxsize=8)
+def _screenshot_part(screenshot_path, mtime_ns, size):
+    """Read a screenshot as an inline PNG part; the mtime/size arguments key the cache to the file's contents"""
+    # Gemini resizes images itself, so the PNG is sent as saved: no decode, upscale or re-encode
+    with open(screenshot_path, "rb") as image_file:
+        return {"mime_type": "image/png", "data": image_file.read()}
+
+
 def loose_parse_json(json_string: str):
 
 
@@ -110,15 +126,9 @@ def get_gpt_response(current_memory, turns, screenshot_path):
           
     content_parts = [f"The screenshot is the current in-game situation. Respond accordingly."]
 
-    original_image = PIL.Image.open(screenshot_path)
-            
-    # Scale the image to 3x its original size for better detail recognition
-    scale_factor = 3
-    scaled_width = original_image.width * scale_factor
-    scaled_height = original_image.height * scale_factor
-    scaled_image = original_image.resize((scaled_width, scaled_height), PIL.Image.LANCZOS)
-    
-    content_parts.append(scaled_image)
+    # A retried turn resends the same file, so reuse its bytes
+    st = os.stat(screenshot_path)
+    content_parts.append(_screenshot_part(screenshot_path, st.st_mtime_ns, st.st_size))
         
     response = chat.send_message(
             content=content_parts,
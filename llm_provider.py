@@ -1,10 +1,47 @@
 #!/usr/bin/env python3
 from abc import ABC, abstractmethod
 from PIL import Image
+import base64
+import io
 import os
 import sys
+import time
 import traceback
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+OPENAI_SYSTEM_PROMPT = "You are an AI playing Pokémon Fire Red."
+
+
+def encode_image_base64(img):
+    """
+    Encode an image as base64 PNG data for API payloads
+    
+    Args:
+        img: Path to an image file or a PIL Image object
+        
+    Returns:
+        str: Base64-encoded PNG data, or None if the image can't be used
+    """
+    if isinstance(img, str):
+        if not os.path.exists(img):
+            return None
+        with open(img, 'rb') as f:
+            data = f.read()
+        # PNG files go out byte-for-byte, skipping a decode and re-encode
+        if data.startswith(PNG_SIGNATURE):
+            return base64.b64encode(data).decode("utf-8")
+        img = Image.open(io.BytesIO(data))
+    
+    if isinstance(img, Image.Image):
+        # Game Boy frames are tiny, so the fastest zlib level costs almost nothing in size
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG", compress_level=1)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    
+    return None
+
+
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
     
@@ -115,14 +152,13 @@ class OpenAIProvider(LLMProvider):
                 response = self.client.chat.completions.create(
                     model=self.config["model_name"],
                     messages=[
-                        {"role": "system", "content": "You are an AI playing Pokémon Fire Red."},
+                        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
                         {"role": "user", "content": prompt}
                     ]
                 )
                 return response.choices[0].message.content
             
             # Add a small delay to ensure images are fully written
-            import time
             time.sleep(0.1)
             
             # Prepare content for API - start with text
@@ -131,19 +167,9 @@ class OpenAIProvider(LLMProvider):
             # Only use the current (first) image for reliability
             if images and len(images) > 0:
                 try:
-                    current_img = images[0]
-                    
-                    # Process the image
-                    import io
-                    import base64
+                    base64_image = encode_image_base64(images[0])
                     
-                    # Convert to PNG in memory
-                    if isinstance(current_img, Image.Image):
-                        buffer = io.BytesIO()
-                        current_img.save(buffer, format="PNG")
-                        buffer.seek(0)
-                        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                        
+                    if base64_image:
                         # Add to message content
                         message_content.append({
                             "type": "image_url",
@@ -159,7 +185,7 @@ class OpenAIProvider(LLMProvider):
             response = self.client.chat.completions.create(
                 model=self.config["model_name"],
                 messages=[
-                    {"role": "system", "content": "You are an AI playing Pokémon Fire Red."},
+                    {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
                     {"role": "user", "content": message_content}
                 ]
             )
@@ -217,7 +243,6 @@ class AnthropicProvider(LLMProvider):
                 return response.content[0].text
             
             # Add a small delay to ensure images are fully written
-            import time
             time.sleep(0.1)
             
             # Create message content with text and images
@@ -233,16 +258,8 @@ class AnthropicProvider(LLMProvider):
             if images:
                 for img in images:
                     try:
-                        if isinstance(img, Image.Image):
-                            # Convert PIL Image to base64
-                            import io
-                            import base64
-                            
-                            buffer = io.BytesIO()
-                            img.save(buffer, format="PNG")
-                            buffer.seek(0)
-                            base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                            
+                        base64_image = encode_image_base64(img)
+                        if base64_image:
                             content.append({
                                 "type": "image",
                                 "source": {
@@ -291,7 +308,8 @@ def get_llm_provider(config):
         LLMProvider: An instance of the appropriate LLM provider
     """
     provider_name = config.get("llm_provider", "").lower()
-    provider_config = config.get("providers", {}).get(provider_name, {})
+    providers = config.get("providers")
+    provider_config = providers.get(provider_name) if providers else None
     
     if not provider_config:
         print(f"Warning: No configuration found for provider '{provider_name}'")